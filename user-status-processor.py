@@ -1,10 +1,32 @@
 import pandas as pd
+import numpy as np
+import csv
 import logging
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterator, Optional, Tuple, Union
 import os
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow es opcional; se usa pandas como respaldo
+    pa = None
+    pc = None
+    pacsv = None
+
+# Strings respaldados por Arrow si está disponible, para usar sus kernels en .str
+STRING_DTYPE = pd.StringDtype('pyarrow') if pa is not None else pd.StringDtype()
+
 class UserStatusProcessor:
+    STRING_COLUMNS = ['email', 'Work Email', 'active', 'Employment Status']
+    EMAIL_COLUMNS = ['email', 'Work Email']
+    OUTPUT_COLUMNS = ['first_name', 'last_name', 'email', 'country',
+                      'department', 'branch', 'phone', 'manager',
+                      'job_title', 'group', 'active']
+    TERMINATIONS_COLUMNS = ['Work Email', 'Employment Status']
+    OUTPUT_FORMATS = ('csv', 'parquet')
+
     def __init__(self, log_level: str = "INFO"):
         self.setup_logging(log_level)
         self.logger = logging.getLogger(__name__)
@@ -15,133 +37,312 @@ class UserStatusProcessor:
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
     
-    def clean_string(self, value) -> str:
-        """Limpia y convierte valores a string de manera segura."""
-        if pd.isna(value):  # Maneja NaN y None
-            return ""
-        return str(value).strip()
-
     def clean_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Limpia el DataFrame convirtiendo valores a string donde sea necesario."""
-        df_clean = df.copy()
+        """Limpia el DataFrame convirtiendo valores a string donde sea necesario.
         
+        Solo se usa sin pyarrow (con pyarrow la limpieza la hace clean_table). Modifica
+        df en el lugar: siempre recibe un DataFrame recién leído.
+        """
         # Convertir columnas específicas a string
-        string_columns = ['email', 'Work Email', 'active', 'Employment Status']
-        for col in string_columns:
-            if col in df_clean.columns:
-                df_clean[col] = df_clean[col].apply(self.clean_string)
+        for col in self.STRING_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].fillna('').astype(STRING_DTYPE).str.strip()
+                # Los emails se normalizan a minúsculas una sola vez, aquí
+                if col in self.EMAIL_COLUMNS:
+                    df[col] = df[col].str.lower()
+        
+        # active tiene pocos valores distintos: como categoría se compara sobre códigos enteros
+        if 'active' in df.columns:
+            df['active'] = df['active'].str.upper().astype('category')
         
-        return df_clean
+        return df
+
+    def clean_table(self, table: "pa.Table") -> "pa.Table":
+        """Equivalente a clean_dataframe sobre una tabla de Arrow, antes de convertirla a pandas."""
+        for col in self.STRING_COLUMNS:
+            if col not in table.column_names:
+                continue
+            values = pc.utf8_trim_whitespace(pc.fill_null(table[col].cast(pa.string()), ''))
+            if col in self.EMAIL_COLUMNS:
+                values = pc.utf8_lower(values)
+            elif col == 'active':
+                values = pc.dictionary_encode(pc.utf8_upper(values))
+            table = table.set_column(table.schema.get_field_index(col), col, values)
+        return table
+
+    def table_to_dataframe(self, table: "pa.Table") -> pd.DataFrame:
+        """Limpia la tabla en Arrow y cede sus buffers a pandas sin copia adicional."""
+        return self.clean_table(table).to_pandas(types_mapper=self.arrow_to_pandas_dtype,
+                                                 split_blocks=True, self_destruct=True)
+
+    def arrow_to_pandas_dtype(self, arrow_type: "pa.DataType"):
+        """types_mapper para to_pandas: strings como STRING_DTYPE, diccionarios como categoría."""
+        if pa.types.is_dictionary(arrow_type):
+            return None
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+            return STRING_DTYPE
+        return pd.ArrowDtype(arrow_type)
 
-    def read_csv_file(self, file_path: str) -> Optional[pd.DataFrame]:
+    def read_header(self, file_path: str) -> List[str]:
+        """Devuelve los nombres de columna de la cabecera del CSV."""
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            return next(csv.reader(f))
+
+    def read_csv_file(self, file_path: str, usecols: Optional[List[str]] = None,
+                      use_pyarrow: bool = True) -> Optional[pd.DataFrame]:
+        """Lee el CSV (solo usecols si se indica) con todas las columnas como texto."""
         try:
-            self.logger.info(f"Leyendo archivo: {file_path}")
-            df = pd.read_csv(file_path)
-            df = self.clean_dataframe(df)  # Limpiamos los datos
-            self.logger.info(f"Archivo leído exitosamente. Registros: {len(df)}")
+            self.logger.info("Leyendo archivo: %s", file_path)
+            if use_pyarrow and pacsv is not None:
+                # Parser multihilo de pyarrow; todas las columnas se leen como string de Arrow
+                string_columns = usecols or self.read_header(file_path)
+                table = pacsv.read_csv(
+                    file_path,
+                    # Las exportaciones de RRHH pueden traer celdas entre comillas con saltos de línea
+                    parse_options=pacsv.ParseOptions(newlines_in_values=True),
+                    convert_options=pacsv.ConvertOptions(
+                        include_columns=usecols,
+                        strings_can_be_null=True,
+                        column_types={col: pa.string() for col in string_columns}
+                    )
+                )
+                df = self.table_to_dataframe(table)
+                del table
+            else:
+                df = pd.read_csv(file_path, usecols=usecols, dtype=str)
+                df = self.clean_dataframe(df)  # Limpiamos los datos
+            self.logger.info("Archivo leído exitosamente. Registros: %d", len(df))
             return df
         except Exception as e:
-            self.logger.error(f"Error al leer el archivo {file_path}: {str(e)}")
+            self.logger.error("Error al leer el archivo %s: %s", file_path, e)
+            return None
+
+    def read_terminated_emails(self, file_path: str, use_pyarrow: bool = True) -> Optional[frozenset]:
+        """Devuelve el set de emails con estado 'Terminated', sin conservar el DataFrame leído."""
+        terminations_df = self.read_csv_file(file_path, usecols=self.TERMINATIONS_COLUMNS,
+                                             use_pyarrow=use_pyarrow)
+        if terminations_df is None:
             return None
+        
+        # Emails ya limpios y en minúsculas; los vacíos (antes nulos) se excluyen para no
+        # inactivar a los usuarios de Ninjo sin email
+        terminated_emails = frozenset(
+            terminations_df.loc[
+                terminations_df['Employment Status'].eq('Terminated')
+                & terminations_df['Work Email'].ne(''), 'Work Email'
+            ]
+        )
+        return terminated_emails
+
+    def stream_ninjo(self, file_path: str, chunk_rows: int = 200_000,
+                     block_size: int = 32 << 20, use_pyarrow: bool = True) -> Iterator[pd.DataFrame]:
+        """Lee el archivo de Ninjo por bloques, ya limpios.
+        
+        Con pyarrow cada bloque son block_size bytes del CSV; sin pyarrow se usan
+        bloques de chunk_rows filas con pandas. Los errores de lectura se propagan
+        sin registrarse aquí: los registra process_files.
+        """
+        self.logger.info("Leyendo archivo por bloques: %s", file_path)
+        total_rows = 0
+        for chunk in self._read_ninjo_chunks(file_path, chunk_rows, block_size, use_pyarrow):
+            total_rows += len(chunk)
+            yield chunk
+        self.logger.info("Archivo leído exitosamente. Registros: %d", total_rows)
 
-    def validate_data(self, ninjo_df: pd.DataFrame, output_df: pd.DataFrame, terminated_emails: set) -> Tuple[bool, str]:
+    def _read_ninjo_chunks(self, file_path: str, chunk_rows: int, block_size: int,
+                           use_pyarrow: bool) -> Iterator[pd.DataFrame]:
+        """Genera los bloques limpios de Ninjo con pyarrow, o con pandas si no está disponible o no se pide."""
+        if use_pyarrow and pacsv is not None:
+            # Lector en streaming de pyarrow: parser multihilo dentro de cada bloque
+            reader = pacsv.open_csv(
+                file_path,
+                read_options=pacsv.ReadOptions(block_size=block_size),
+                parse_options=pacsv.ParseOptions(newlines_in_values=True),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=self.OUTPUT_COLUMNS,
+                    strings_can_be_null=True,
+                    column_types={col: pa.string() for col in self.OUTPUT_COLUMNS}
+                )
+            )
+            for batch in reader:
+                yield self.table_to_dataframe(pa.Table.from_batches([batch]))
+        else:
+            for chunk in pd.read_csv(file_path, usecols=self.OUTPUT_COLUMNS, dtype=str, chunksize=chunk_rows):
+                yield self.clean_dataframe(chunk)
+
+    def value_set(self, emails: frozenset) -> Union[frozenset, "pa.Array"]:
+        """Prepara un set de emails para is_in: array de Arrow con pyarrow, el propio set sin él."""
+        if pc is not None:
+            return pa.array(list(emails), type=pa.string())
+        return emails
+
+    def build_masks(self, ninjo_df: pd.DataFrame,
+                    terminated_emails: Union[frozenset, "pa.Array"]) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve las máscaras (ya inactivos, terminados) sin crear columnas auxiliares."""
+        # active ya viene en mayúsculas y como categoría desde clean_dataframe
+        inactive = (ninjo_df['active'] == 'FALSE').to_numpy(dtype=bool)
+        if pc is not None:
+            terminated = pc.is_in(
+                pa.array(ninjo_df['email'], type=pa.string()), value_set=terminated_emails
+            ).to_numpy(zero_copy_only=False)
+        else:
+            terminated = ninjo_df['email'].isin(terminated_emails).to_numpy(dtype=bool)
+        return inactive, terminated
+
+    def match_emails(self, emails: pd.Series, value_set: Union[frozenset, "pa.Array"],
+                     negate: bool = False) -> List[str]:
+        """Devuelve los emails que están en value_set, o los que no están si negate."""
+        if pc is not None:
+            emails_arr = pa.array(emails, type=pa.string())
+            found = pc.is_in(emails_arr, value_set=value_set)
+            return pc.filter(emails_arr, pc.invert(found) if negate else found).to_pylist()
+
+        found = emails.isin(value_set)
+        return emails[~found if negate else found].tolist()
+
+    def validate_data(self, ninjo_inactive: Union[frozenset, "pa.Array"], output_df: pd.DataFrame,
+                      terminated_emails: Union[frozenset, "pa.Array"]) -> Tuple[bool, str]:
+        """Valida el output; los sets de emails llegan ya preparados con value_set."""
         try:
             # 1. Verificar duplicados
-            if output_df['email'].duplicated().any():
-                return False, "El output contiene emails duplicados"
+            # Los nulos se reportan en el chequeo 6; aquí se excluyen para poder ordenar
+            emails, counts = np.unique(output_df['email'].dropna().to_numpy(), return_counts=True)
+            if (duplicated := emails[counts > 1]).size:
+                return False, f"El output contiene emails duplicados: {duplicated.tolist()}"
 
             # 2. Verificar usuarios previamente inactivos
-            output_emails = set(output_df['email'].str.lower())
-            ninjo_inactive = set(ninjo_df[ninjo_df['active'].str.upper() == 'FALSE']['email'].str.lower())
-            
-            if overlap := output_emails.intersection(ninjo_inactive):
+            if overlap := self.match_emails(output_df['email'], ninjo_inactive):
                 return False, f"El output contiene usuarios que ya estaban inactivos: {overlap}"
 
             # 3. Verificar usuarios terminados
-            if not_terminated := output_emails.difference(terminated_emails):
+            if not_terminated := self.match_emails(output_df['email'], terminated_emails, negate=True):
                 return False, f"El output contiene usuarios que no están en la lista de terminados: {not_terminated}"
 
             # 4. Verificar columnas requeridas
-            required_columns = ['first_name', 'last_name', 'email', 'country', 'department', 
-                              'branch', 'phone', 'manager', 'job_title', 'group', 'active']
-            if missing := set(required_columns) - set(output_df.columns):
+            if missing := set(self.OUTPUT_COLUMNS) - set(output_df.columns):
                 return False, f"Faltan columnas requeridas en el output: {missing}"
 
             # 5. Verificar valores active
-            if not (output_df['active'] == 'FALSE').all():
+            if not np.array_equal(output_df['active'].to_numpy(), np.full(len(output_df), 'FALSE')):
                 return False, "Algunos registros no tienen 'FALSE' en el campo active"
 
-            # 6. Verificar valores nulos
+            # 6. Verificar valores nulos (una sola pasada sobre todos los campos críticos)
             critical_fields = ['email', 'first_name', 'last_name', 'active']
-            for field in critical_fields:
-                if output_df[field].isna().any():
-                    return False, f"Hay valores nulos en el campo crítico: {field}"
+            nulls = output_df[critical_fields].isna().any()
+            if nulls.any():
+                return False, f"Hay valores nulos en el campo crítico: {nulls[nulls].index.tolist()}"
 
             return True, "Validación exitosa"
         except Exception as e:
             return False, f"Error durante la validación: {str(e)}"
 
-    def process_files(self, ninjo_file: str, terminations_file: str, output_file: str) -> bool:
+    def check_output_format(self, output_format: str) -> None:
+        """Lanza ValueError si el formato no está soportado o requiere pyarrow y no está instalado."""
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"Formato de salida no soportado: {output_format}")
+        if output_format == "parquet" and pa is None:
+            raise ValueError("El formato parquet requiere pyarrow")
+
+    def output_path(self, output_file: str, output_format: str = "csv") -> str:
+        """Devuelve la ruta que realmente se genera para el formato pedido."""
+        if output_format == "parquet":
+            return os.path.splitext(output_file)[0] + ".parquet"
+        return output_file
+
+    def write_output(self, output_df: pd.DataFrame, output_file: str, output_format: str = "csv",
+                     pyarrow_csv: bool = False) -> str:
+        """Escribe el output en CSV o Parquet y devuelve la ruta generada.
+        
+        pyarrow_csv usa el writer multihilo de pyarrow, que entrecomilla todos los campos
+        de texto; por defecto se usa to_csv de pandas, sin comillas.
+        """
+        self.check_output_format(output_format)
+        output_file = self.output_path(output_file, output_format)
+        if output_format == "parquet":
+            output_df.to_parquet(output_file, index=False, compression="zstd")
+        elif pyarrow_csv and pacsv is not None:
+            pacsv.write_csv(pa.Table.from_pandas(output_df, preserve_index=False), output_file)
+        else:
+            output_df.to_csv(output_file, index=False, lineterminator='\n')
+        return output_file
+
+    def process_files(self, ninjo_file: str, terminations_file: str, output_file: str,
+                      chunk_rows: int = 200_000, output_format: str = "csv",
+                      pyarrow_csv: bool = False, use_pyarrow: bool = True,
+                      block_size: int = 32 << 20) -> bool:
+        """Genera el archivo de usuarios a inactivar.
+        
+        Ninjo se lee por bloques: con pyarrow el tamaño lo fija block_size (bytes del CSV);
+        con pandas (use_pyarrow=False o sin pyarrow instalado) lo fija chunk_rows (filas).
+        """
+        # Validar el formato antes de leer los archivos
+        try:
+            self.check_output_format(output_format)
+        except ValueError as e:
+            self.logger.error("%s", e)
+            return False
+        
         try:
-            # Leer y limpiar archivos
-            ninjo_df = self.read_csv_file(ninjo_file)
-            terminations_df = self.read_csv_file(terminations_file)
+            # Leer terminaciones primero: solo sus emails se usan para filtrar Ninjo
+            terminated_emails = self.read_terminated_emails(terminations_file, use_pyarrow)
             
-            if ninjo_df is None or terminations_df is None:
+            if terminated_emails is None:
                 return False
             
-            # Crear set de emails terminados (ya limpios por clean_dataframe)
-            terminated_emails = set(
-                terminations_df[
-                    terminations_df['Employment Status'] == 'Terminated'
-                ]['Work Email'].str.lower()
-            )
-            
-            # Procesar datos de Ninjo (ya limpios por clean_dataframe)
-            ninjo_df['email_lower'] = ninjo_df['email'].str.lower()
-            ninjo_df['active_upper'] = ninjo_df['active'].str.upper()
+            # Set de terminados preparado una sola vez para todos los bloques y la validación
+            terminated_values = self.value_set(terminated_emails)
             
-            # Identificar nuevos usuarios a inactivar
-            new_inactive = ninjo_df[
-                (ninjo_df['active_upper'] != 'FALSE') & 
-                (ninjo_df['email_lower'].isin(terminated_emails))
-            ].copy()
+            # Leer Ninjo por bloques conservando solo los nuevos usuarios a inactivar
+            new_inactive_chunks = []
+            inactive_emails = set()
+            ninjo_count = 0
+            inactive_count = 0
+            for chunk in self.stream_ninjo(ninjo_file, chunk_rows, block_size, use_pyarrow):
+                inactive_mask, terminated_mask = self.build_masks(chunk, terminated_values)
+                new_inactive_chunks.append(chunk.loc[~inactive_mask & terminated_mask, self.OUTPUT_COLUMNS])
+                # El chequeo 2 solo puede encontrar emails terminados: basta con guardar esos,
+                # así el set nunca supera al de terminados
+                inactive_emails.update(chunk.loc[inactive_mask & terminated_mask, 'email'])
+                ninjo_count += len(chunk)
+                inactive_count += int(inactive_mask.sum())
             
-            # Preparar DataFrame de salida
-            output_columns = ['first_name', 'last_name', 'email', 'country', 
-                            'department', 'branch', 'phone', 'manager', 
-                            'job_title', 'group', 'active']
+            ninjo_inactive = self.value_set(frozenset(inactive_emails))
             
-            output_df = new_inactive[output_columns].copy()
+            # Preparar DataFrame de salida (concat ya crea un DataFrame nuevo, no hace falta .copy())
+            if new_inactive_chunks:
+                output_df = pd.concat(new_inactive_chunks, ignore_index=True)
+            else:
+                output_df = pd.DataFrame(columns=self.OUTPUT_COLUMNS)
             output_df['active'] = 'FALSE'
             
             # Validar output
-            is_valid, validation_message = self.validate_data(ninjo_df, output_df, terminated_emails)
+            is_valid, validation_message = self.validate_data(ninjo_inactive, output_df, terminated_values)
             if not is_valid:
-                self.logger.error(f"Error de validación: {validation_message}")
+                self.logger.error("Error de validación: %s", validation_message)
                 return False
             
-            # Logging de estadísticas
+            # Logging de estadísticas (formato diferido: solo se interpola si INFO está habilitado)
             self.logger.info("\nEstadísticas de procesamiento:")
-            self.logger.info(f"- Total registros en Ninjo: {len(ninjo_df)}")
-            self.logger.info(f"- Total usuarios terminados: {len(terminated_emails)}")
-            self.logger.info(f"- Usuarios ya inactivos en Ninjo: {len(ninjo_df[ninjo_df['active_upper'] == 'FALSE'])}")
-            self.logger.info(f"- Nuevos usuarios a inactivar: {len(output_df)}")
+            self.logger.info("- Total registros en Ninjo: %d", ninjo_count)
+            self.logger.info("- Total usuarios terminados: %d", len(terminated_emails))
+            self.logger.info("- Usuarios ya inactivos en Ninjo: %d", inactive_count)
+            self.logger.info("- Nuevos usuarios a inactivar: %d", len(output_df))
             
             # Generar archivo
-            output_df.to_csv(output_file, index=False)
-            self.logger.info(f"Archivo de salida generado exitosamente: {output_file}")
+            output_file = self.write_output(output_df, output_file, output_format, pyarrow_csv)
+            self.logger.info("Archivo de salida generado exitosamente: %s", output_file)
             
             # Mostrar ejemplos
-            if len(output_df) > 0:
+            if len(output_df) > 0 and self.logger.isEnabledFor(logging.INFO):
                 self.logger.info("\nEjemplos de registros a inactivar:")
-                for _, row in output_df.head(3).iterrows():
-                    self.logger.info(f"- {row['email']} ({row['first_name']} {row['last_name']})")
+                examples = output_df.head(3)[['email', 'first_name', 'last_name']].to_numpy()
+                for email, first_name, last_name in examples:
+                    self.logger.info("- %s (%s %s)", email, first_name, last_name)
             
             return True
             
         except Exception as e:
-            self.logger.error(f"Error durante el procesamiento: {str(e)}")
+            self.logger.error("Error durante el procesamiento: %s", e)
             return False
 
 def main():
@@ -149,18 +350,20 @@ def main():
     ninjo_file = "Ninjo-Employees-export.csv"
     terminations_file = f"{current_date}_81OP_Terminations_All_Countries_Clara.csv"
     output_file = f"{current_date}_users_to_inactivate.csv"
+    output_format = "csv"  # "csv" o "parquet"
     
     processor = UserStatusProcessor(log_level="INFO")
     
     success = processor.process_files(
         ninjo_file=ninjo_file,
         terminations_file=terminations_file,
-        output_file=output_file
+        output_file=output_file,
+        output_format=output_format
     )
     
     if success:
         print(f"\nProceso completado exitosamente.")
-        print(f"Archivo generado: {output_file}")
+        print(f"Archivo generado: {processor.output_path(output_file, output_format)}")
     else:
         print("\nError durante el proceso. Revise los logs para más detalles.")
 